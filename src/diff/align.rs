@@ -1,166 +1,320 @@
 
-use difference::Changeset;
+use super::cache::BoundedCache;
+use super::lcs;
+use std::collections::HashMap;
 use std::fmt;
+use std::thread;
 use std::vec::Vec;
 
-#[derive(Clone)]
-struct Point {
-    x: usize,
-    y: usize,
+// Don't bother spreading the edit distance computation across threads for
+// fewer line pairs than this, as it wouldn't cover the cost of the threads.
+const PARALLEL_MIN_PAIRS: usize = 256;
+
+// The number of recently used line pairs whose alignment weights are kept.
+const WEIGHT_CACHE_SIZE: usize = 4096;
+
+// The number of recently used before lines whose match vectors are kept. Each
+// is at least a kilobyte, so far fewer of these are kept than weights.
+const PATTERN_CACHE_SIZE: usize = 256;
+
+// Caches the weight of aligning recently seen pairs of lines, so that a line
+// pair which recurs across nearby replaced blocks only has its edit distance
+// computed once. The cache is bounded so that memory peaks with the largest
+// replaced block, rather than growing with every block in the diff. Likewise
+// caches the match vectors of recently seen before lines, so a before line
+// which recurs (paired with different after lines) only has them built once.
+pub struct AlignmentCache<'a> {
+    weights: BoundedCache<(&'a str, &'a str), i32>,
+    patterns: BoundedCache<&'a str, lcs::Pattern<'a>>,
 }
 
-impl fmt::Display for Point {
-    fn fmt(&self, f: &mut fmt::Formatter) -> fmt::Result {
-        write!(f, "({},{})", self.x, self.y)
+impl<'a> AlignmentCache<'a> {
+    pub fn new() -> AlignmentCache<'a> {
+        AlignmentCache { weights: BoundedCache::new(WEIGHT_CACHE_SIZE),
+                         patterns: BoundedCache::new(PATTERN_CACHE_SIZE) }
     }
 }
-impl fmt::Debug for Point {
-    fn fmt(&self, f: &mut fmt::Formatter) -> fmt::Result {
-        write!(f, "({},{})", self.x, self.y)
-    }
+
+// Marks a weight which is not in the cache. Real weights are never negative.
+const UNCACHED: i32 = -1;
+
+// The relax weight of a node which no path has reached yet. Weights are
+// summed with saturating arithmetic, so no real path weight can exceed it.
+const UNREACHED: i32 = std::i32::MAX;
+
+// Returns the distinct lines in lines, in order of first occurrence, along
+// with the index of each line within them.
+fn unique_lines<'a>(lines: &Vec<&'a str>) -> (Vec<&'a str>, Vec<usize>) {
+    let mut unique = Vec::new();
+    let mut unique_index = HashMap::with_capacity(lines.len());
+    let indices = lines.iter().map(|line| {
+        *unique_index.entry(*line).or_insert_with(|| {
+            unique.push(*line);
+            unique.len() - 1
+        })
+    }).collect();
+    (unique, indices)
 }
 
-struct AlignmentNode {
-    id: Point,
-    weight: i32,
-    relax_weight: i32,
-    relax_parent: Point,
+// Computes the weight of aligning every line in lines_b with every line in
+// lines_a, as a row-major |B| x |A| matrix. Code commonly repeats lines (blank
+// lines, closing braces), so the weights are computed between the distinct
+// lines only and then expanded out to the full matrix.
+fn aligned_weights<'a>(lines_b: &Vec<&'a str>, lines_a: &Vec<&'a str>,
+                       cache: &mut AlignmentCache<'a>) -> Vec<i32> {
+    let (unique_b, indices_b) = unique_lines(lines_b);
+    let (unique_a, indices_a) = unique_lines(lines_a);
+    let unique_weights = unique_aligned_weights(&unique_b, &unique_a, cache);
+    if unique_b.len() == lines_b.len() && unique_a.len() == lines_a.len() {
+        return unique_weights;
+    }
+    let mut weights = Vec::with_capacity(lines_b.len() * lines_a.len());
+    for index_b in indices_b {
+        let row = &unique_weights[index_b * unique_a.len()..(index_b + 1) * unique_a.len()];
+        weights.extend(indices_a.iter().map(|index_a| row[*index_a]));
+    }
+    weights
 }
 
-impl AlignmentNode {
-    fn new(x: usize, y: usize, weight: i32) -> AlignmentNode {
-        AlignmentNode {
-            id: Point { x, y },
-            weight: weight,
-            relax_weight: std::i32::MAX,
-            relax_parent: Point { x: 0, y: 0 },
+// Computes the weight of aligning every line in lines_b with every line in
+// lines_a, as aligned_weights, for lines which are each distinct. Each before
+// line's match vectors are fetched from the cache (or computed) once and
+// reused against every after line, and rows are split across the available
+// cores.
+fn unique_aligned_weights<'a>(lines_b: &Vec<&'a str>, lines_a: &Vec<&'a str>,
+                              cache: &mut AlignmentCache<'a>) -> Vec<i32> {
+    let mut weights = Vec::with_capacity(lines_b.len() * lines_a.len());
+    let mut uncached = 0;
+    for line_b in lines_b {
+        for line_a in lines_a {
+            let weight = match cache.weights.get(&(*line_b, *line_a)) {
+                Some(weight) => *weight,
+                None => UNCACHED,
+            };
+            if weight == UNCACHED {
+                uncached += 1;
+            }
+            weights.push(weight);
         }
     }
-
-    fn relax(&mut self, predecessor_id: &Point, predecessor_weight: i32) {
-        let candidate_weight = predecessor_weight + self.weight;
-        if self.relax_weight > candidate_weight {
-            self.relax_weight = candidate_weight;
-            self.relax_parent = predecessor_id.clone();
+    if uncached == 0 {
+        return weights;
+    }
+    // Take the match vectors of each row with uncached weights out of the
+    // cache (or build them) for the duration of the block, so the cache's
+    // bound doesn't limit the size of a block, and return them afterwards.
+    let mut patterns = Vec::with_capacity(lines_b.len());
+    for (line_b, row) in lines_b.iter().zip(weights.chunks(lines_a.len())) {
+        if row.contains(&UNCACHED) {
+            patterns.push(Some(cache.patterns.remove(line_b)
+                               .unwrap_or_else(|| lcs::Pattern::new(line_b))));
+        } else {
+            patterns.push(None);
         }
     }
-}
-
-impl fmt::Display for AlignmentNode {
-    fn fmt(&self, f: &mut fmt::Formatter) -> fmt::Result {
-        write!(f, "{}: {}", self.id, self.weight)
+    let fill_rows = |first_row: usize, rows: &mut [i32]| {
+        for (i, row) in rows.chunks_mut(lines_a.len()).enumerate() {
+            if !row.contains(&UNCACHED) {
+                continue;
+            }
+            let pattern = patterns[first_row + i].as_ref()
+                    .expect("rows with uncached weights have match vectors");
+            for (weight, line_a) in row.iter_mut().zip(lines_a) {
+                if *weight == UNCACHED {
+                    let (edit_dist, operations) = pattern.distance_and_operations(line_a);
+                    // Saturate rather than overflow for (absurdly) long lines.
+                    *weight = edit_dist.saturating_mul((operations+1) / 2);
+                }
+            }
+        }
+    };
+    let threads = match thread::available_parallelism() {
+        Ok(n) if uncached >= PARALLEL_MIN_PAIRS => n.get().min(lines_b.len()),
+        _ => 1,
+    };
+    if threads <= 1 {
+        fill_rows(0, &mut weights);
+    } else {
+        let rows_per_thread = (lines_b.len() + threads - 1) / threads;
+        let fill_rows = &fill_rows;
+        thread::scope(|scope| {
+            let chunks = weights.chunks_mut(rows_per_thread * lines_a.len());
+            for (i, rows) in chunks.enumerate() {
+                scope.spawn(move || fill_rows(i * rows_per_thread, rows));
+            }
+        });
+    }
+    for (line_b, pattern) in lines_b.iter().zip(patterns) {
+        if let Some(pattern) = pattern {
+            cache.patterns.insert(line_b, pattern);
+        }
+    }
+    for (line_b, row) in lines_b.iter().zip(weights.chunks(lines_a.len())) {
+        for (line_a, weight) in lines_a.iter().zip(row) {
+            cache.weights.insert((*line_b, *line_a), *weight);
+        }
     }
+    weights
 }
-impl fmt::Debug for AlignmentNode {
-    fn fmt(&self, f: &mut fmt::Formatter) -> fmt::Result {
-        write!(f, "{}: \u{1D464}={},\u{1D451}={},\u{1D70B}={}", self.id,
-               self.weight, self.relax_weight, self.relax_parent)
+
+// Relaxes every edge in the x_len x y_len line matrix, whose fields are given
+// as row-major slices. This is kept free of the AlignmentMatrix so the
+// compiler sees nothing but plain slices and integers in the hot loop: the
+// slice lengths are checked once up front, letting it hoist the per-node
+// bounds checks out of the loop.
+fn relax_all(weight: &[i32], relax_weight: &mut [i32],
+             relax_parent_x: &mut [u32], relax_parent_y: &mut [u32],
+             x_len: usize, y_len: usize) {
+    let len = x_len * y_len;
+    let weight = &weight[..len];
+    let relax_weight = &mut relax_weight[..len];
+    let relax_parent_x = &mut relax_parent_x[..len];
+    let relax_parent_y = &mut relax_parent_y[..len];
+    // Relaxes the successors of the node (x, y), given the first of them.
+    let mut relax_successors = |x: usize, y: usize, next_x: usize, next_y: usize| {
+        let vertex_weight = relax_weight[x * y_len + y];
+        let mut relax = |i: usize| {
+            let candidate_weight = vertex_weight.saturating_add(weight[i]);
+            if relax_weight[i] > candidate_weight {
+                relax_weight[i] = candidate_weight;
+                relax_parent_x[i] = x as u32;
+                relax_parent_y[i] = y as u32;
+            }
+        };
+        // If I just paired x and y, what are the remaining valid
+        // alignments? These are relaxed in place rather than collected
+        // into an adjacency list, as this is the innermost loop.
+        let next_x_aligned = next_x + 1; // might not exist
+        let next_y_aligned = next_y + 1; // might not exist
+        if next_x_aligned < x_len {
+            relax(next_x_aligned * y_len + next_y);
+        }
+        if next_y_aligned < y_len {
+            relax(next_x * y_len + next_y_aligned);
+        }
+        if next_x_aligned < x_len && next_y_aligned < y_len {
+            relax(next_x_aligned * y_len + next_y_aligned);
+        }
+    };
+    // Walk each row's nodes by the parity of y, so each loop has a fixed
+    // successor formula and no node has to be skipped (nodes with both x and
+    // y even pair nothing, and are never visited). The successors of a node
+    // in an odd row all lie in the next rows, so its even and odd columns
+    // may be walked separately. (Columns y-1 and y, for odd y-1, share their
+    // successors; walking the odd columns first keeps ties resolved in favour
+    // of the earlier column.) Those of a node in an even row include the
+    // node two columns along, so even rows must be walked in ascending y,
+    // and the rows themselves in order: walking each parity class over the
+    // whole matrix in turn would relax nodes before their predecessors.
+    for x in 0..x_len {
+        if x & 1 == 0 {
+            for y in (1..y_len).step_by(2) {
+                relax_successors(x, y, x, y + 1);
+            }
+        } else {
+            for y in (1..y_len).step_by(2) {
+                relax_successors(x, y, x + 1, y + 1);
+            }
+            for y in (0..y_len).step_by(2) {
+                relax_successors(x, y, x + 1, y);
+            }
+        }
     }
 }
 
+// The matrix is stored as a structure of arrays, each holding one field for
+// every node in row-major order, rather than as a matrix of node structs. The
+// relax pass only touches a couple of fields per node, so this keeps far more
+// of the nodes it is working on in cache. For the same reason the parent
+// coordinates are stored as u32 rather than usize, halving their footprint;
+// a matrix with more than 2^32 rows or columns would not fit in memory anyway.
 struct AlignmentMatrix {
-    line_matrix: Vec<Vec<AlignmentNode>>,
+    weight: Vec<i32>,
+    relax_weight: Vec<i32>,
+    relax_parent_x: Vec<u32>,
+    relax_parent_y: Vec<u32>,
     line_matrix_x_len: usize,
     line_matrix_y_len: usize,
 }
 
 impl AlignmentMatrix {
-    fn new(lines_b: &Vec<&str>, lines_a: &Vec<&str>) -> AlignmentMatrix {
+    fn new<'a>(lines_b: &Vec<&'a str>, lines_a: &Vec<&'a str>,
+               cache: &mut AlignmentCache<'a>) -> AlignmentMatrix {
         let lines_b_len = lines_b.len();
         let lines_a_len = lines_a.len();
         let line_matrix_x_len = lines_b_len * 2 + 1;
         let line_matrix_y_len = lines_a_len * 2 + 1;
+        let line_matrix_len = line_matrix_x_len * line_matrix_y_len;
         // Compute the baseline or benchmark 'unalignment' scores - i.e. the
         // scores if the lines were unaligned. We must do no worse than
         // unalignment.
         // First for all the 'before' lines.
-        let mut unalign_b_weights = Vec::with_capacity(lines_b_len);
-        for line_b in lines_b {
-            unalign_b_weights.push(line_b.len() as i32);
-        }
+        let unalign_b_weights: Vec<i32> = lines_b.iter().map(|l| l.len() as i32).collect();
         // Then for all the 'after' lines.
-        let mut unalign_a_weights = Vec::with_capacity(lines_a_len);
-        for line_a in lines_a {
-            unalign_a_weights.push(line_a.len() as i32);
-        }
+        let unalign_a_weights: Vec<i32> = lines_a.iter().map(|l| l.len() as i32).collect();
         // Next, compute the edit distance for all lines to one another - i.e.
         // if every line were aligned with one another.
-        let mut line_matrix = Vec::with_capacity(line_matrix_x_len);
-        for x in 0..line_matrix_x_len {
-            let aligned_x = x & 1 != 0;
-            let mut row = Vec::with_capacity(line_matrix_y_len);
-            for y in 0..line_matrix_y_len {
-                let aligned_y = y & 1 != 0;
-                let weight: i32 = match (aligned_x, aligned_y) {
-                    (false, false) => -1,
-                    (true, false) => unalign_b_weights[x/2],
-                    (false, true) => unalign_a_weights[y/2],
-                    (true, true) => {
-                        let line_b = lines_b[x/2];
-                        let line_a = lines_a[y/2];
-                        let changeset = Changeset::new(line_b, line_a, "");
-                        let edit_dist = changeset.distance;
-                        let operations = changeset.diffs.len() as i32;
-                        edit_dist * ((operations+1) / 2)
-                    },
-                };
-                row.push(AlignmentNode::new(x, y, weight));
+        let align_weights = aligned_weights(lines_b, lines_a, cache);
+        // Finally lay these out in the matrix. Rather than matching on the
+        // parity of every node, fill each row with strided copies: even rows
+        // alternate between unused nodes and the 'after' lines' unalignment
+        // scores, odd rows between the row's 'before' line's unalignment
+        // score and its aligned scores.
+        let mut weight = vec![-1; line_matrix_len];
+        for (x, row) in weight.chunks_mut(line_matrix_y_len).enumerate() {
+            if x & 1 == 0 {
+                for (w, unalign_a) in row[1..].iter_mut().step_by(2).zip(&unalign_a_weights) {
+                    *w = *unalign_a;
+                }
+            } else {
+                let aligned = &align_weights[(x/2) * lines_a_len..(x/2 + 1) * lines_a_len];
+                for w in row.iter_mut().step_by(2) {
+                    *w = unalign_b_weights[x/2];
+                }
+                for (w, align) in row[1..].iter_mut().step_by(2).zip(aligned) {
+                    *w = *align;
+                }
             }
-            line_matrix.push(row);
         }
         // Chuck it in a struct and ship it.
-        AlignmentMatrix { line_matrix,
+        AlignmentMatrix { weight,
+                          relax_weight: vec![UNREACHED; line_matrix_len],
+                          relax_parent_x: vec![0; line_matrix_len],
+                          relax_parent_y: vec![0; line_matrix_len],
                           line_matrix_x_len, line_matrix_y_len }
     }
 
-    fn root_adjacency(&self) -> Vec<Point> {
-        let mut adjacency = Vec::with_capacity(3);
-        adjacency.push(Point { x: 0, y: 1 });
-        adjacency.push(Point { x: 1, y: 0 });
-        adjacency.push(Point { x: 1, y: 1 });
-        // The nodes in the output are guaranteed to be in topological order.
-        return adjacency;
+    fn index(&self, x: usize, y: usize) -> usize {
+        x * self.line_matrix_y_len + y
     }
 
-    fn adjacency(&self, node: &AlignmentNode) -> Vec<Point> {
-        // If I just paired node.id.x and node.id.y, what are the remaining
-        // valid alignments?
+    fn root_adjacency(&self) -> Vec<(usize, usize)> {
         let mut adjacency = Vec::with_capacity(3);
-        let next_x = node.id.x + (node.id.x & 1); // will exist
-        let next_y = node.id.y + (node.id.y & 1); // will exist
-        let next_x_aligned = next_x + 1; // might not exist
-        let next_y_aligned = next_y + 1; // might not exist
-        if next_x_aligned < self.line_matrix_x_len {
-            adjacency.push(Point { x: next_x_aligned, y: next_y });
-        }
-        if next_y_aligned < self.line_matrix_y_len {
-            adjacency.push(Point { x: next_x, y: next_y_aligned });
-        }
-        if next_x_aligned < self.line_matrix_x_len && next_y_aligned < self.line_matrix_y_len {
-            adjacency.push(Point { x: next_x_aligned, y: next_y_aligned });
-        }
+        adjacency.push((0, 1));
+        adjacency.push((1, 0));
+        adjacency.push((1, 1));
         // The nodes in the output are guaranteed to be in topological order.
         return adjacency;
     }
 
-    fn walk_path(&self, exit: &AlignmentNode) -> Vec<Point> {
+    fn walk_path(&self, exit: (usize, usize)) -> Vec<(usize, usize)> {
         let mut path = Vec::with_capacity(self.line_matrix_x_len / 2 + self.line_matrix_y_len / 2);
         let mut pos = exit;
-        while pos.id.x > 0 || pos.id.y > 0 {
-            path.push(pos.id.clone());
-            let next = &self.line_matrix[pos.id.x][pos.id.y].relax_parent;
-            pos = &self.line_matrix[next.x][next.y];
+        while pos.0 > 0 || pos.1 > 0 {
+            let i = self.index(pos.0, pos.1);
+            path.push(pos);
+            pos = (self.relax_parent_x[i] as usize, self.relax_parent_y[i] as usize);
         }
         path.reverse();
         return path;
     }
 
-    fn shortest_path(&mut self) -> Vec<Point> {
+    fn shortest_path(&mut self) -> Vec<(usize, usize)> {
         // Initialize the root adjacency nodes (i.e. those accessible from
         // the single source node).
         for adj in self.root_adjacency() {
-            let vertex = &mut self.line_matrix[adj.x][adj.y];
-            vertex.relax_weight = 0;
+            let i = self.index(adj.0, adj.1);
+            self.relax_weight[i] = 0;
         }
         // Walk all nodes.
         // The line matrix is iterated in topological order, line by line, since
@@ -174,30 +328,28 @@ impl AlignmentMatrix {
         // exploiting the structure of the data. The walk will visit
         // 3|A||B| + |A| + |B| nodes, relaxing at most 3 nodes from each (i.e.
         // O(|A||B|) or linear complexity).
-        for x in 0..self.line_matrix_x_len {
-            for y in 0..self.line_matrix_y_len {
-                if (x | y) & 1 == 0 {
-                    continue;
-                }
-                let vertex = &self.line_matrix[x][y];
-                let vertex_id = vertex.id.clone();
-                let vertex_weight = vertex.relax_weight;
-                let adjacency = self.adjacency(vertex);
-                for adj in adjacency {
-                    let child = &mut self.line_matrix[adj.x][adj.y];
-                    child.relax(&vertex_id, vertex_weight);
-                }
-            }
-        }
+        // The walk is deliberately single threaded. Nodes on an anti-diagonal
+        // could be relaxed in parallel, but only by pulling from predecessors
+        // (two nodes on a diagonal can share a successor, so pushing to them
+        // races), and synchronizing threads once per diagonal costs more than
+        // the handful of integer operations per node it would spread out.
+        // The expensive part of alignment, the edit distances, is already
+        // parallelized in aligned_weights.
+        relax_all(&self.weight, &mut self.relax_weight,
+                  &mut self.relax_parent_x, &mut self.relax_parent_y,
+                  self.line_matrix_x_len, self.line_matrix_y_len);
         // Derive the shortest path from the walk.
         // There are three legal exit points, so choose the best of these and
         // walk its parents backwards.
-        let exit_xy = &self.line_matrix[self.line_matrix_x_len-2][self.line_matrix_y_len-2];
-        let exit_x  = &self.line_matrix[self.line_matrix_x_len-2][self.line_matrix_y_len-1];
-        let exit_y  = &self.line_matrix[self.line_matrix_x_len-1][self.line_matrix_y_len-2];
-        if exit_x.relax_weight < exit_y.relax_weight && exit_x.relax_weight < exit_xy.relax_weight {
+        let exit_xy = (self.line_matrix_x_len-2, self.line_matrix_y_len-2);
+        let exit_x  = (self.line_matrix_x_len-2, self.line_matrix_y_len-1);
+        let exit_y  = (self.line_matrix_x_len-1, self.line_matrix_y_len-2);
+        let exit_xy_weight = self.relax_weight[self.index(exit_xy.0, exit_xy.1)];
+        let exit_x_weight  = self.relax_weight[self.index(exit_x.0, exit_x.1)];
+        let exit_y_weight  = self.relax_weight[self.index(exit_y.0, exit_y.1)];
+        if exit_x_weight < exit_y_weight && exit_x_weight < exit_xy_weight {
             return self.walk_path(exit_x);
-        } else if exit_y.relax_weight < exit_xy.relax_weight {
+        } else if exit_y_weight < exit_xy_weight {
             return self.walk_path(exit_y);
         } else {
             return self.walk_path(exit_xy);
@@ -210,7 +362,7 @@ impl fmt::Display for AlignmentMatrix {
         write!(f, "Alignment matrix ({} x {}):\n", self.line_matrix_x_len, self.line_matrix_y_len)?;
         for x in 0..self.line_matrix_x_len {
             for y in 0..self.line_matrix_y_len {
-                write!(f, " {:4}", self.line_matrix[x][y].weight)?;
+                write!(f, " {:4}", self.weight[self.index(x, y)])?;
             }
             write!(f, "\n")?;
         }
@@ -218,21 +370,22 @@ impl fmt::Display for AlignmentMatrix {
     }
 }
 
-pub fn align<'a>(lines_b: &Vec<&'a str>, lines_a: &Vec<&'a str>) ->
+pub fn align<'a>(lines_b: &Vec<&'a str>, lines_a: &Vec<&'a str>,
+                 cache: &mut AlignmentCache<'a>) ->
         Vec<(Option<&'a str>, Option<&'a str>)> {
-    let mut matrix = AlignmentMatrix::new(lines_b, lines_a);
+    let mut matrix = AlignmentMatrix::new(lines_b, lines_a, cache);
     let path = matrix.shortest_path();
     let mut alignment = Vec::with_capacity(lines_b.len() + lines_a.len());
     for point in path {
         let before;
         let after;
-        if point.x & 1 > 0 {
-            before = Some(lines_b[point.x / 2]);
+        if point.0 & 1 > 0 {
+            before = Some(lines_b[point.0 / 2]);
         } else {
             before = None;
         }
-        if point.y & 1 > 0 {
-            after = Some(lines_a[point.y / 2]);
+        if point.1 & 1 > 0 {
+            after = Some(lines_a[point.1 / 2]);
         } else {
             after = None;
         }
@@ -240,3 +393,61 @@ pub fn align<'a>(lines_b: &Vec<&'a str>, lines_a: &Vec<&'a str>) ->
     }
     return alignment;
 }
+
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn aligned_weights_nonzero() {
+        let lines_b = vec!["let x = 1;", "same"];
+        let lines_a = vec!["let y = 2;", "same"];
+        let mut cache = AlignmentCache::new();
+        // 4 characters differ, over 7 runs: 4 * ((7+1) / 2).
+        let weights = aligned_weights(&lines_b, &lines_a, &mut cache);
+        assert_eq!(16, weights[0]);
+        assert!(weights[1] > 0);
+        assert!(weights[2] > 0);
+        assert_eq!(0, weights[3]);
+        // And once more from the cache.
+        assert_eq!(weights, aligned_weights(&lines_b, &lines_a, &mut cache));
+    }
+
+    #[test]
+    fn aligned_weights_duplicates() {
+        let lines_b = vec!["}", "let x = 1;", "", "}"];
+        let lines_a = vec!["", "let y = 2;", "}", ""];
+        let weights = aligned_weights(&lines_b, &lines_a, &mut AlignmentCache::new());
+        let mut expected = Vec::new();
+        for line_b in &lines_b {
+            for line_a in &lines_a {
+                let (edit_dist, operations) =
+                        lcs::Pattern::new(line_b).distance_and_operations(line_a);
+                expected.push(edit_dist * ((operations+1) / 2));
+            }
+        }
+        assert_eq!(expected, weights);
+    }
+
+    #[test]
+    fn align_dissimilar() {
+        // Pairing these would take many small edits, which must cost more
+        // than simply removing one line and adding the other.
+        let lines_b = vec!["same", "abcdef"];
+        let lines_a = vec!["same", "xbxdxf"];
+        assert_eq!(vec![(Some("same"), Some("same")),
+                        (Some("abcdef"), None), (None, Some("xbxdxf"))],
+                   align(&lines_b, &lines_a, &mut AlignmentCache::new()));
+    }
+
+    #[test]
+    fn align_similar() {
+        let lines_b = vec!["    let x = 1;", "    bar(x);"];
+        let lines_a = vec!["    let y = 2;", "    baz(y);", "    qux();"];
+        assert_eq!(vec![(Some("    let x = 1;"), Some("    let y = 2;")),
+                        (Some("    bar(x);"), Some("    baz(y);")),
+                        (None, Some("    qux();"))],
+                   align(&lines_b, &lines_a, &mut AlignmentCache::new()));
+    }
+}
@@ -0,0 +1,108 @@
+use std::collections::HashMap;
+use std::hash::Hash;
+use std::mem;
+
+// A map which holds on to roughly the capacity most recently used entries.
+// Entries are kept in two generations: once the current generation is full it
+// becomes the old generation, and the previous old generation is dropped. An
+// entry found in the old generation is moved back into the current one. This
+// approximates least recently used eviction with constant time operations,
+// and never holds more than twice the capacity.
+pub struct BoundedCache<K, V> {
+    capacity: usize,
+    current: HashMap<K, V>,
+    old: HashMap<K, V>,
+}
+
+impl<K: Eq + Hash, V> BoundedCache<K, V> {
+    pub fn new(capacity: usize) -> BoundedCache<K, V> {
+        BoundedCache { capacity, current: HashMap::new(), old: HashMap::new() }
+    }
+
+    fn make_room(&mut self) {
+        if self.current.len() >= self.capacity {
+            self.old = mem::replace(&mut self.current, HashMap::new());
+        }
+    }
+
+    pub fn get(&mut self, key: &K) -> Option<&V> {
+        if !self.current.contains_key(key) {
+            let (key, value) = self.old.remove_entry(key)?;
+            self.make_room();
+            self.current.insert(key, value);
+        }
+        self.current.get(key)
+    }
+
+    pub fn get_or_insert_with<F: FnOnce() -> V>(&mut self, key: K, f: F) -> &V {
+        if self.get(&key).is_some() {
+            return &self.current[&key];
+        }
+        self.make_room();
+        self.current.entry(key).or_insert_with(f)
+    }
+
+    pub fn insert(&mut self, key: K, value: V) {
+        if !self.current.contains_key(&key) {
+            self.old.remove(&key);
+            self.make_room();
+        }
+        self.current.insert(key, value);
+    }
+
+    pub fn remove(&mut self, key: &K) -> Option<V> {
+        self.current.remove(key).or_else(|| self.old.remove(key))
+    }
+}
+
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn bounded_cache_evicts() {
+        let mut cache = BoundedCache::new(2);
+        for i in 0..10 {
+            cache.insert(i, i * 10);
+        }
+        assert!(cache.current.len() + cache.old.len() <= 4);
+        assert_eq!(None, cache.get(&0));
+        assert_eq!(Some(&90), cache.get(&9));
+    }
+
+    #[test]
+    fn bounded_cache_reinserts_stay_bounded() {
+        // Keys recurring irregularly, so they are often found in the old
+        // generation, inserted both directly and after a lookup (as the
+        // alignment weights are).
+        let mut cache = BoundedCache::new(2);
+        for i in 0..200 {
+            cache.insert(i * i % 11, i);
+            assert!(cache.current.len() + cache.old.len() <= 4);
+        }
+        for i in 0..200 {
+            cache.get(&(i * i % 11));
+            cache.insert(i * i % 11, i);
+            assert!(cache.current.len() + cache.old.len() <= 4);
+        }
+    }
+
+    #[test]
+    fn bounded_cache_keeps_recently_used() {
+        let mut cache = BoundedCache::new(2);
+        cache.insert("a", 1);
+        cache.insert("b", 2);
+        cache.insert("c", 3);
+        // "a" is now in the old generation; using it moves it back.
+        assert_eq!(Some(&1), cache.get(&"a"));
+        cache.insert("d", 4);
+        cache.insert("e", 5);
+        assert_eq!(Some(&1), cache.get(&"a"));
+        assert_eq!(None, cache.get(&"b"));
+        assert_eq!(5, *cache.get_or_insert_with("e", || 0));
+        assert_eq!(6, *cache.get_or_insert_with("f", || 6));
+        assert_eq!(Some(6), cache.remove(&"f"));
+        assert_eq!(None, cache.get(&"f"));
+    }
+}
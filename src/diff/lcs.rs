@@ -0,0 +1,292 @@
+use std::collections::HashMap;
+use std::vec::Vec;
+
+pub const WORD_BITS: usize = 64;
+
+// The largest LCS bit matrix, in words, Pattern::chunks will compute.
+const MAX_LCS_WORDS: usize = 1 << 20;
+
+// A run of characters in the edit script transforming one string into
+// another. Within a run of differing characters removals always precede
+// additions.
+#[derive(Debug, PartialEq)]
+pub enum Chunk {
+    Same(usize),
+    Add(usize),
+    Remove(usize),
+}
+
+// Converts the (ascending) indices of the matched elements of two sequences,
+// of lengths a_len and b_len, into an edit script.
+pub fn chunks_from_matches(matches: Vec<(usize, usize)>, a_len: usize, b_len: usize)
+        -> Vec<Chunk> {
+    let mut chunks = Vec::new();
+    let mut i = 0;
+    let mut j = 0;
+    let mut same = 0;
+    for (mi, mj) in matches.into_iter().chain(Some((a_len, b_len))) {
+        if mi > i || mj > j {
+            if same > 0 {
+                chunks.push(Chunk::Same(same));
+                same = 0;
+            }
+            if mi > i {
+                chunks.push(Chunk::Remove(mi - i));
+            }
+            if mj > j {
+                chunks.push(Chunk::Add(mj - j));
+            }
+        }
+        same += 1;
+        i = mi + 1;
+        j = mj + 1;
+    }
+    // The sentinel end-of-sequences match is not a real match.
+    if same > 1 {
+        chunks.push(Chunk::Same(same - 1));
+    }
+    chunks
+}
+
+// Returns the byte offset of the i'th character of s (or its length).
+fn char_offset(s: &str, i: usize) -> usize {
+    s.char_indices().nth(i).map_or(s.len(), |(offset, _)| offset)
+}
+
+// The precomputed match vectors of a string, for use with the bit-parallel
+// longest common subsequence algorithm (Allison-Dix, as refined by Hyyrö).
+// For every character in the string there is a bit vector with bit i set iff
+// the string's i'th character is that character. Each vector is split into
+// 64-bit words so the string may be arbitrarily long; each column of the LCS
+// dynamic programming matrix is then computed with a handful of word
+// operations rather than one operation per cell.
+pub struct Pattern<'a> {
+    s: &'a str,
+    len: usize,
+    words: usize,
+    ascii: Vec<u64>,
+    extended: HashMap<char, Vec<u64>>,
+}
+
+impl<'a> Pattern<'a> {
+    pub fn new(s: &'a str) -> Pattern<'a> {
+        let len = s.chars().count();
+        let words = (len + WORD_BITS - 1) / WORD_BITS;
+        let mut ascii = vec![0; 128 * words];
+        let mut extended = HashMap::new();
+        for (i, c) in s.chars().enumerate() {
+            let bit = 1 << (i % WORD_BITS);
+            if c.is_ascii() {
+                ascii[c as usize * words + i / WORD_BITS] |= bit;
+            } else {
+                extended.entry(c).or_insert_with(|| vec![0; words])[i / WORD_BITS] |= bit;
+            }
+        }
+        Pattern { s, len, words, ascii, extended }
+    }
+
+    fn match_vector(&self, c: char) -> Option<&[u64]> {
+        if c.is_ascii() {
+            let start = c as usize * self.words;
+            Some(&self.ascii[start..start + self.words])
+        } else {
+            self.extended.get(&c).map(|v| v.as_slice())
+        }
+    }
+
+    fn contains(&self, c: char) -> bool {
+        match self.match_vector(c) {
+            Some(m) => m.iter().any(|&w| w != 0),
+            None => false,
+        }
+    }
+
+    // Advances the LCS bit vector s (see lcs_vectors) past the text character
+    // c.
+    fn advance(&self, s: &mut [u64], c: char) {
+        if let Some(m) = self.match_vector(c) {
+            let mut carry = 0;
+            for w in 0..self.words {
+                let u = s[w] & m[w];
+                let (sum, carry_a) = s[w].overflowing_add(u);
+                let (sum, carry_b) = sum.overflowing_add(carry);
+                carry = (carry_a || carry_b) as u64;
+                s[w] = sum | (s[w] & !m[w]);
+            }
+        }
+    }
+
+    // Computes the LCS bit vectors for every prefix of text. The returned
+    // vector holds text.chars().count() rows of self.words words; a zero bit i
+    // in row j means the LCS of the first i+1 pattern characters and the first
+    // j+1 text characters is one longer than that of the first i pattern
+    // characters.
+    fn lcs_vectors(&self, text: &str) -> Vec<u64> {
+        let mut rows = Vec::with_capacity(text.len() * self.words);
+        let mut s = vec![!0u64; self.words];
+        for c in text.chars() {
+            self.advance(&mut s, c);
+            rows.extend_from_slice(&s);
+        }
+        rows
+    }
+
+    // Computes the length of the LCS of text with each prefix of this pattern,
+    // from the last LCS bit vector alone: element i is that of the first i
+    // pattern characters.
+    fn prefix_lcs_lengths(&self, text: &str) -> Vec<usize> {
+        let mut s = vec![!0u64; self.words];
+        for c in text.chars() {
+            self.advance(&mut s, c);
+        }
+        let mut lengths = Vec::with_capacity(self.len + 1);
+        let mut length = 0;
+        lengths.push(length);
+        for i in 0..self.len {
+            if s[i / WORD_BITS] & (1 << (i % WORD_BITS)) == 0 {
+                length += 1;
+            }
+            lengths.push(length);
+        }
+        lengths
+    }
+
+    // Appends the indices of the matched characters of an LCS of this pattern
+    // and text (of text_len characters), offset by offset, to matches in
+    // ascending order. The backtrack keeps a bit vector per character of text,
+    // so where that would be unreasonably large (e.g. minified lines) the
+    // problem is first split in two, as in Hirschberg's algorithm: text is
+    // halved, and this pattern split where the LCS of the pattern's prefix with
+    // the first half plus that of its suffix with the second half is greatest.
+    // This only needs the last bit vector of each half, keeping memory linear.
+    fn push_matches(&self, text: &str, text_len: usize, offset: (usize, usize),
+                    matches: &mut Vec<(usize, usize)>) {
+        if text_len > 1 && self.words * text_len > MAX_LCS_WORDS {
+            let text_mid = text_len / 2;
+            let (text_head, text_tail) = text.split_at(char_offset(text, text_mid));
+            let forward = self.prefix_lcs_lengths(text_head);
+            let reversed: String = self.s.chars().rev().collect();
+            let text_tail_reversed: String = text_tail.chars().rev().collect();
+            let backward = Pattern::new(&reversed).prefix_lcs_lengths(&text_tail_reversed);
+            let mid = (0..=self.len).max_by_key(|&i| forward[i] + backward[self.len - i])
+                                    .expect("there is always at least one split");
+            let (head, tail) = self.s.split_at(char_offset(self.s, mid));
+            Pattern::new(head).push_matches(text_head, text_mid, offset, matches);
+            Pattern::new(tail).push_matches(text_tail, text_len - text_mid,
+                                            (offset.0 + mid, offset.1 + text_mid), matches);
+            return;
+        }
+        let vectors = self.lcs_vectors(text);
+        let bit = |i: usize, j: usize| {
+            vectors[j * self.words + i / WORD_BITS] & (1 << (i % WORD_BITS)) != 0
+        };
+        // Backtrack from the end of both strings to recover the matched
+        // characters (in reverse order).
+        let first_match = matches.len();
+        let mut i = self.len;
+        let mut j = text_len;
+        while i > 0 && j > 0 {
+            if bit(i - 1, j - 1) {
+                // Pattern character i-1 does not contribute to the LCS.
+                i -= 1;
+            } else if j > 1 && !bit(i - 1, j - 2) {
+                // Text character j-1 does not contribute to the LCS.
+                j -= 1;
+            } else {
+                i -= 1;
+                j -= 1;
+                matches.push((offset.0 + i, offset.1 + j));
+            }
+        }
+        matches[first_match..].reverse();
+    }
+
+    // Computes the edit script, in characters, transforming this pattern into
+    // text using only additions and removals.
+    pub fn chunks(&self, text: &str) -> Vec<Chunk> {
+        let text_len = text.chars().count();
+        let mut matches = Vec::new();
+        self.push_matches(text, text_len, (0, 0), &mut matches);
+        chunks_from_matches(matches, self.len, text_len)
+    }
+
+    // Computes the edit distance (the number of characters added or removed)
+    // between this pattern and text, along with the number of runs in the
+    // edit script.
+    pub fn distance_and_operations(&self, text: &str) -> (i32, i32) {
+        // If the strings have no characters in common (e.g. lines from
+        // unrelated blocks of code) then the edit script is simply to remove
+        // everything and add everything. This is determined with a single
+        // scan of text, skipping the LCS computation and its backtrack.
+        if !text.chars().any(|c| self.contains(c)) {
+            let text_len = text.chars().count();
+            let operations = (self.len > 0) as i32 + (text_len > 0) as i32;
+            return ((self.len + text_len) as i32, operations);
+        }
+        let chunks = self.chunks(text);
+        let mut distance = 0;
+        for chunk in &chunks {
+            match chunk {
+                Chunk::Same(_) => {},
+                Chunk::Add(n) | Chunk::Remove(n) => distance += *n as i32,
+            }
+        }
+        (distance, chunks.len() as i32)
+    }
+}
+
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn chunks_empty() {
+        assert_eq!(Vec::<Chunk>::new(), Pattern::new("").chunks(""));
+        assert_eq!(vec![Chunk::Add(3)], Pattern::new("").chunks("abc"));
+        assert_eq!(vec![Chunk::Remove(3)], Pattern::new("abc").chunks(""));
+    }
+
+    #[test]
+    fn chunks_same() {
+        assert_eq!(vec![Chunk::Same(5)], Pattern::new("hello").chunks("hello"));
+    }
+
+    #[test]
+    fn chunks_replace() {
+        assert_eq!(vec![Chunk::Same(1), Chunk::Remove(1), Chunk::Add(1), Chunk::Same(3)],
+                   Pattern::new("hello").chunks("hallo"));
+    }
+
+    #[test]
+    fn chunks_unicode() {
+        assert_eq!(vec![Chunk::Same(1), Chunk::Remove(1), Chunk::Add(1), Chunk::Same(1)],
+                   Pattern::new("a\u{e9}b").chunks("a\u{e8}b"));
+    }
+
+    #[test]
+    fn distance_disjoint() {
+        assert_eq!((0, 0), Pattern::new("").distance_and_operations(""));
+        assert_eq!((3, 1), Pattern::new("").distance_and_operations("abc"));
+        assert_eq!((3, 1), Pattern::new("abc").distance_and_operations(""));
+        assert_eq!((5, 2), Pattern::new("abc").distance_and_operations("xy"));
+        assert_eq!((4, 5), Pattern::new("abc").distance_and_operations("xbz"));
+    }
+
+    #[test]
+    fn distance_multi_word() {
+        let before = "abcdefghij".repeat(20);
+        let after = before.replace("e", "");
+        assert_eq!((20, 41), Pattern::new(&before).distance_and_operations(&after));
+        assert_eq!((20, 41), Pattern::new(&after).distance_and_operations(&before));
+    }
+
+    #[test]
+    fn distance_long_lines() {
+        // Too long for a single LCS bit matrix, so split up first.
+        let before = "abcdefghij".repeat(1000);
+        let after = before.replace("e", "");
+        assert!(Pattern::new(&before).words * after.len() > MAX_LCS_WORDS);
+        assert_eq!((1000, 2001), Pattern::new(&before).distance_and_operations(&after));
+    }
+}
@@ -1,13 +1,19 @@
 mod align;
+mod cache;
+mod lcs;
+mod myers;
 mod wrap;
 
-use align::align;
+use align::{align, AlignmentCache};
+use cache::BoundedCache;
 use ansi_term::{ANSIString, ANSIStrings};
 use ansi_term::Color::{Red, Green, Black, Fixed};
 use ansi_term::Style;
-use difference::{Changeset, Difference};
 use itertools::EitherOrBoth;
 use itertools::Itertools;
+use lcs::Chunk;
+use std::io;
+use std::io::Write;
 use wrap::{wrap_str, wrap_ansistrings};
 
 #[derive(Debug)]
@@ -26,81 +32,102 @@ struct DiffStyling {
     remove_highlight: Style,
 }
 
+// The number of recently styled line pairs whose character diffs are kept.
+const CHAR_DIFF_CACHE_SIZE: usize = 4096;
+
 pub fn calculate_line_diff(left: &str, right: &str) -> Vec<Diff> {
-    calculate_diff(left, right, "\n")
+    calculate_diff(left, right, "\n", |l, r| myers::chunks(l, r))
 }
 
 pub fn calculate_char_diff(left: &str, right: &str) -> Vec<Diff> {
-    calculate_diff(left, right, "")
+    calculate_diff(left, right, "", _char_chunks)
+}
+
+// Computes the edit script between the characters of two lines, using the
+// bit-parallel LCS, which processes 64 characters per word operation.
+fn _char_chunks(left_parts: &[&str], right_parts: &[&str]) -> Vec<Chunk> {
+    lcs::Pattern::new(&left_parts.concat()).chunks(&right_parts.concat())
+}
+
+// Splits s into the parts calculate_diff compares: its characters if split is
+// empty, otherwise the substrings between each split.
+fn _split_parts<'a>(s: &'a str, split: &str) -> Vec<&'a str> {
+    if split.is_empty() {
+        s.char_indices().map(|(i, c)| &s[i..i + c.len_utf8()]).collect()
+    } else {
+        s.split(split).collect()
+    }
 }
 
-fn calculate_diff(left: &str, right: &str, split: &str) -> Vec<Diff> {
-    let mut changeset = Changeset::new(left, right, split);
+fn calculate_diff(left: &str, right: &str, split: &str,
+                  chunks: fn(&[&str], &[&str]) -> Vec<Chunk>) -> Vec<Diff> {
+    // Most diffs are between inputs which share a long common prefix and
+    // suffix, so strip those off with a linear scan and only hand the
+    // differing middle to the diff algorithm.
+    let left_parts = _split_parts(left, split);
+    let right_parts = _split_parts(right, split);
+    let head = left_parts.iter().zip(&right_parts)
+            .take_while(|(l, r)| l == r).count();
+    let tail = left_parts[head..].iter().rev().zip(right_parts[head..].iter().rev())
+            .take_while(|(l, r)| l == r).count();
+    let left_middle = &left_parts[head..left_parts.len() - tail];
+    let right_middle = &right_parts[head..right_parts.len() - tail];
+
     let mut diffs = Vec::new();
-    let mut previous: Option<Difference> = None;
+    if head > 0 {
+        diffs.push(Diff::Same(left_parts[..head].join(split)));
+    }
+    match (left_middle.is_empty(), right_middle.is_empty()) {
+        (true, true) => {},
+        (true, false) => diffs.push(Diff::Add(right_middle.join(split))),
+        (false, true) => diffs.push(Diff::Remove(left_middle.join(split))),
+        (false, false) => {
+            let chunks = chunks(left_middle, right_middle);
+            _push_chunk_diffs(left_middle, right_middle, split, chunks, &mut diffs);
+        },
+    }
+    if tail > 0 {
+        diffs.push(Diff::Same(left_parts[left_parts.len() - tail..].join(split)));
+    }
+    diffs
+}
 
-    for change in changeset.diffs.drain(..) {
-        match change {
-            Difference::Same(same) => {
-                match previous {
-                    Some(last_change) => {
-                        diffs.push(match last_change {
-                            Difference::Same(_) => panic!("Invalid state"),
-                            Difference::Add(add) => Diff::Add(add),
-                            Difference::Rem(rem) => Diff::Remove(rem),
-                        });
-                        previous = None;
-                    },
-                    None => {},
-                }
-                diffs.push(Diff::Same(same));
+// Converts the edit script transforming left_parts into right_parts into diffs,
+// pairing each removal with any immediately following addition to form a
+// replacement.
+fn _push_chunk_diffs(left_parts: &[&str], right_parts: &[&str], split: &str,
+                     chunks: Vec<Chunk>, diffs: &mut Vec<Diff>) {
+    let mut i = 0;
+    let mut j = 0;
+    let mut chunks = chunks.into_iter().peekable();
+    while let Some(chunk) = chunks.next() {
+        match chunk {
+            Chunk::Same(n) => {
+                diffs.push(Diff::Same(left_parts[i..i + n].join(split)));
+                i += n;
+                j += n;
             },
-            Difference::Add(add) => {
-                match previous {
-                    Some(last_change) => {
-                        diffs.push(match last_change {
-                            Difference::Same(_) => panic!("Invalid state"),
-                            Difference::Add(_) => panic!("Invalid state"),
-                            Difference::Rem(rem) => Diff::Replace(rem, add),
-                        });
-                        previous = None;
-                    },
-                    None => {
-                        previous = Some(Difference::Add(add));
-                    },
-                }
+            Chunk::Add(n) => {
+                diffs.push(Diff::Add(right_parts[j..j + n].join(split)));
+                j += n;
             },
-            Difference::Rem(rem) => {
-                match previous {
-                    Some(last_change) => {
-                        diffs.push(match last_change {
-                            Difference::Same(_) => panic!("Invalid state"),
-                            Difference::Add(add) => Diff::Replace(rem, add),
-                            Difference::Rem(_) => panic!("Invalid state"),
-                        });
-                        previous = None;
-                    },
-                    None => {
-                        previous = Some(Difference::Rem(rem));
+            Chunk::Remove(n) => {
+                let rem = left_parts[i..i + n].join(split);
+                i += n;
+                match chunks.peek() {
+                    Some(&Chunk::Add(m)) => {
+                        chunks.next();
+                        diffs.push(Diff::Replace(rem, right_parts[j..j + m].join(split)));
+                        j += m;
                     },
+                    _ => diffs.push(Diff::Remove(rem)),
                 }
-            }
+            },
         }
     }
-    match previous {
-        Some(uncommitted) => {
-            diffs.push(match uncommitted {
-                Difference::Same(_) => panic!("Invalid state"),
-                Difference::Add(add) => Diff::Add(add),
-                Difference::Rem(rem) => Diff::Remove(rem),
-            });
-        },
-        None => {},
-    }
-    diffs
 }
 
-pub fn print_diffs(diffs: &Vec<Diff>, context: usize, color: bool) {
+pub fn print_diffs(diffs: &Vec<Diff>, context: usize, color: bool) -> io::Result<()> {
     let margin_styling = DiffStyling {
         same:             Style::default(),
         add:              Style::default(),
@@ -115,6 +142,10 @@ pub fn print_diffs(diffs: &Vec<Diff>, context: usize, color: bool) {
         remove:           Red.normal(),
         remove_highlight: Black.on(Red),
     };
+    let mut alignment_cache = AlignmentCache::new();
+    let mut char_diff_cache = BoundedCache::new(CHAR_DIFF_CACHE_SIZE);
+    let stdout = io::stdout();
+    let mut out = io::BufWriter::new(stdout.lock());
 
     for change in diffs {
         match change {
@@ -122,27 +153,27 @@ pub fn print_diffs(diffs: &Vec<Diff>, context: usize, color: bool) {
                 for line in same.split('\n') {
                     let margin = margin_styling.same.paint("  ");
                     let fmt = line_styling.same.paint(line);
-                    println!("{}{}", margin, fmt);
+                    writeln!(out, "{}{}", margin, fmt)?;
                 }
             },
             Diff::Add(add) => {
                 for line in add.split('\n') {
                     let margin = margin_styling.add.paint("+ ");
                     let fmt = line_styling.add.paint(line);
-                    println!("{}{}", margin, fmt);
+                    writeln!(out, "{}{}", margin, fmt)?;
                 }
             },
             Diff::Remove(rem) => {
                 for line in rem.split('\n') {
                     let margin = margin_styling.remove.paint("- ");
                     let fmt = line_styling.remove.paint(line);
-                    println!("{}{}", margin, fmt);
+                    writeln!(out, "{}{}", margin, fmt)?;
                 }
             },
             Diff::Replace(before, after) => {
                 let lines_b = before.split('\n').collect();
                 let lines_a = after.split('\n').collect();
-                let alignment = align(&lines_b, &lines_a);
+                let alignment = align(&lines_b, &lines_a, &mut alignment_cache);
                 let mut fmts_b = Vec::new();
                 let mut fmts_a = Vec::new();
                 for aligned in alignment {
@@ -161,6 +192,7 @@ pub fn print_diffs(diffs: &Vec<Diff>, context: usize, color: bool) {
                             fmts_b.push(margin_styling.remove.paint("- "));
                             fmts_a.push(margin_styling.add.paint("+ "));
                             _style_diff_line(before, after, &line_styling,
+                                             &mut char_diff_cache,
                                              &mut fmts_b, &mut fmts_a);
                             fmts_b.push(Style::default().paint("\n"));
                             fmts_a.push(Style::default().paint("\n"));
@@ -168,11 +200,12 @@ pub fn print_diffs(diffs: &Vec<Diff>, context: usize, color: bool) {
                         (None, None) => {},
                     }
                 }
-                print!("{}", ANSIStrings(&fmts_b));
-                print!("{}", ANSIStrings(&fmts_a));
+                write!(out, "{}", ANSIStrings(&fmts_b))?;
+                write!(out, "{}", ANSIStrings(&fmts_a))?;
             },
         }
     }
+    out.flush()
 }
 
 fn calc_max_line_width(diffs: &Vec<Diff>) -> (usize, usize){
@@ -215,62 +248,80 @@ fn calc_max_line_width(diffs: &Vec<Diff>) -> (usize, usize){
     return max_width;
 }
 
-fn _print_side_by_side_line(lineno_l: ANSIString,
+fn _print_side_by_side_line(out: &mut impl Write,
+                            lineno_l: ANSIString,
                             lineno_r: ANSIString,
                             wrapno_l: ANSIString,
                             wrapno_r: ANSIString,
                             line_l:   &Vec<ANSIString>,
                             line_r:   &Vec<ANSIString>,
                             line_width: (usize, usize),
-                            separator: &str) {
+                            separator: &str) -> io::Result<()> {
     let mut margin_l = &lineno_l;
     let mut margin_r = &lineno_r;
     let line_l_iter = wrap_ansistrings(line_l, line_width.0);
     let line_r_iter = wrap_ansistrings(line_r, line_width.1);
     let mut first_iteration = true;
     for zipped in line_l_iter.zip_longest(line_r_iter) {
+        // Once one side has run out of wrapped lines it is blank. The blank
+        // side is written as formatter padding rather than allocating a
+        // string of spaces for every line.
         let (wrapped_l, wrapped_r) = match zipped {
-            EitherOrBoth::Both(l, r) => (l, r),
-            EitherOrBoth::Left(l)    => (l, " ".repeat(line_width.1)),
-            EitherOrBoth::Right(r)   => (" ".repeat(line_width.0), r),
+            EitherOrBoth::Both(l, r) => (Some(l), Some(r)),
+            EitherOrBoth::Left(l)    => (Some(l), None),
+            EitherOrBoth::Right(r)   => (None, Some(r)),
         };
 
         // TODO: optimize to expoit ANSIStrings
-        println!("{} {}{}{} {}",
-                 margin_l, wrapped_l, separator, margin_r, wrapped_r);
+        match wrapped_l {
+            Some(l) => write!(out, "{} {}{}", margin_l, l, separator)?,
+            None    => write!(out, "{} {:w$}{}", margin_l, "", separator, w=line_width.0)?,
+        }
+        match wrapped_r {
+            Some(r) => writeln!(out, "{} {}", margin_r, r)?,
+            None    => writeln!(out, "{} {:w$}", margin_r, "", w=line_width.1)?,
+        }
         if first_iteration {
             margin_l = &wrapno_l;
             margin_r = &wrapno_r;
             first_iteration = true;
         }
     }
+    Ok(())
 }
 
+// Styles the character level differences between an aligned pair of lines.
+// The character diffs of recently styled pairs are memoized in char_diff_cache,
+// since the same pair of lines commonly recurs across a diff (e.g. a renamed
+// identifier).
 fn _style_diff_line<'u>(before: &'u str, after: &'u str, styling: &DiffStyling,
+        char_diff_cache: &mut BoundedCache<(&'u str, &'u str), Vec<Diff>>,
         before_fmts: &mut Vec<ANSIString<'u>>,
         after_fmts: &mut Vec<ANSIString<'u>>) {
-    for char_change in calculate_char_diff(before, after) {
+    let char_diffs = char_diff_cache.get_or_insert_with((before, after),
+            || calculate_char_diff(before, after));
+    for char_change in char_diffs.iter() {
         match char_change {
             Diff::Same(same) => {
                 before_fmts.push(styling.remove.paint(same.clone()));
-                after_fmts.push( styling.add.paint(same));
+                after_fmts.push( styling.add.paint(same.clone()));
             },
             Diff::Add(add) => {
-                after_fmts.push( styling.add_highlight.paint(add));
+                after_fmts.push( styling.add_highlight.paint(add.clone()));
             },
             Diff::Remove(rem) => {
-                before_fmts.push(styling.remove_highlight.paint(rem));
+                before_fmts.push(styling.remove_highlight.paint(rem.clone()));
             },
             Diff::Replace(rem, add) => {
-                before_fmts.push(styling.remove_highlight.paint(rem));
-                after_fmts.push( styling.add_highlight.paint(add));
+                before_fmts.push(styling.remove_highlight.paint(rem.clone()));
+                after_fmts.push( styling.add_highlight.paint(add.clone()));
             }
         }
     }
 }
 
 pub fn print_diffs_side_by_side(diffs: &Vec<Diff>, max_line_count: usize,
-                                context: usize, color: bool) {
+                                context: usize, color: bool) -> io::Result<()> {
     // Define styling constants.
     let lineno_styling = DiffStyling {
         same:             Black.bold(),
@@ -319,6 +370,10 @@ pub fn print_diffs_side_by_side(diffs: &Vec<Diff>, max_line_count: usize,
     let mut lineno_l = 1;
     let mut lineno_r = 1;
     let empty_lineno = " ".repeat(lineno_width + 1);
+    let mut alignment_cache = AlignmentCache::new();
+    let mut char_diff_cache = BoundedCache::new(CHAR_DIFF_CACHE_SIZE);
+    let stdout = io::stdout();
+    let mut out = io::BufWriter::new(stdout.lock());
     for change in diffs {
         match change {
             Diff::Same(same) => {
@@ -326,13 +381,14 @@ pub fn print_diffs_side_by_side(diffs: &Vec<Diff>, max_line_count: usize,
                     let lineno_l_fmt = format!("{:w$}:", lineno_l, w=lineno_width);
                     let lineno_r_fmt = format!("{:w$}:", lineno_r, w=lineno_width);
                     _print_side_by_side_line(
+                            &mut out,
                             lineno_styling.same.paint(&lineno_l_fmt),
                             lineno_styling.same.paint(&lineno_r_fmt),
                             lineno_styling.same.paint(&empty_lineno),
                             lineno_styling.same.paint(&empty_lineno),
                             &vec![line_styling.same.paint(line)],
                             &vec![line_styling.same.paint(line)],
-                            line_width, sep);
+                            line_width, sep)?;
                     lineno_l += 1;
                     lineno_r += 1;
                 }
@@ -341,13 +397,14 @@ pub fn print_diffs_side_by_side(diffs: &Vec<Diff>, max_line_count: usize,
                 for line_r in add.split('\n') {
                     let lineno_r_fmt = format!("{:w$}:", lineno_r, w=lineno_width);
                     _print_side_by_side_line(
+                            &mut out,
                             lineno_styling.same.paint(&empty_lineno),
                             lineno_styling.add_highlight.paint(&lineno_r_fmt),
                             lineno_styling.same.paint(&empty_lineno),
                             lineno_styling.add_highlight.paint(&empty_lineno),
                             &vec![line_styling.same.paint("")],
                             &vec![line_styling.add_highlight.paint(line_r)],
-                            line_width, sep);
+                            line_width, sep)?;
                     lineno_r += 1;
                 }
             },
@@ -355,44 +412,47 @@ pub fn print_diffs_side_by_side(diffs: &Vec<Diff>, max_line_count: usize,
                 for line_l in rem.split('\n') {
                     let lineno_l_fmt = format!("{:w$}:", lineno_l, w=lineno_width);
                     _print_side_by_side_line(
+                            &mut out,
                             lineno_styling.remove_highlight.paint(&lineno_l_fmt),
                             lineno_styling.same.paint(&empty_lineno),
                             lineno_styling.remove_highlight.paint(&empty_lineno),
                             lineno_styling.same.paint(&empty_lineno),
                             &vec![line_styling.remove_highlight.paint(line_l)],
                             &vec![line_styling.same.paint("")],
-                            line_width, sep);
+                            line_width, sep)?;
                     lineno_l += 1;
                 }
             },
             Diff::Replace(before, after) => {
                 let lines_b = before.split('\n').collect();
                 let lines_a = after.split('\n').collect();
-                let alignment = align(&lines_b, &lines_a);
+                let alignment = align(&lines_b, &lines_a, &mut alignment_cache);
                 for aligned in alignment {
                     match aligned {
                         (Some(line_l), None) => {
                             let lineno_l_fmt = format!("{:w$}:", lineno_l, w=lineno_width);
                             _print_side_by_side_line(
+                                    &mut out,
                                     lineno_styling.remove_highlight.paint(&lineno_l_fmt),
                                     lineno_styling.same.paint(&empty_lineno),
                                     lineno_styling.remove_highlight.paint(&empty_lineno),
                                     lineno_styling.same.paint(&empty_lineno),
                                     &vec![line_styling.remove_highlight.paint(line_l)],
                                     &vec![line_styling.same.paint("")],
-                                    line_width, sep);
+                                    line_width, sep)?;
                             lineno_l += 1;
                         },
                         (None, Some(line_r)) => {
                             let lineno_r_fmt = format!("{:w$}:", lineno_r, w=lineno_width);
                             _print_side_by_side_line(
+                                    &mut out,
                                     lineno_styling.same.paint(&empty_lineno),
                                     lineno_styling.add_highlight.paint(&lineno_r_fmt),
                                     lineno_styling.same.paint(&empty_lineno),
                                     lineno_styling.add_highlight.paint(&empty_lineno),
                                     &vec![line_styling.same.paint("")],
                                     &vec![line_styling.add_highlight.paint(line_r)],
-                                    line_width, sep);
+                                    line_width, sep)?;
                             lineno_r += 1;
                         },
                         (Some(line_l), Some(line_r)) => {
@@ -401,15 +461,17 @@ pub fn print_diffs_side_by_side(diffs: &Vec<Diff>, max_line_count: usize,
                             let mut fmt_l = Vec::new();
                             let mut fmt_r = Vec::new();
                             _style_diff_line(line_l, line_r, &line_styling,
+                                             &mut char_diff_cache,
                                              &mut fmt_l, &mut fmt_r);
                             _print_side_by_side_line(
+                                    &mut out,
                                     lineno_styling.remove.paint(&lineno_l_fmt),
                                     lineno_styling.add.paint(&lineno_r_fmt),
                                     lineno_styling.remove.paint(&empty_lineno),
                                     lineno_styling.add.paint(&empty_lineno),
                                     &fmt_l,
                                     &fmt_r,
-                                    line_width, sep);
+                                    line_width, sep)?;
                             lineno_l += 1;
                             lineno_r += 1;
                         },
@@ -419,4 +481,46 @@ pub fn print_diffs_side_by_side(diffs: &Vec<Diff>, max_line_count: usize,
             },
         }
     }
+    out.flush()
+}
+
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn diff_str(diffs: Vec<Diff>) -> String {
+        format!("{:?}", diffs)
+    }
+
+    #[test]
+    fn line_diff_same() {
+        assert_eq!(r#"[Same("a\nb")]"#, diff_str(calculate_line_diff("a\nb", "a\nb")));
+    }
+
+    #[test]
+    fn line_diff_add() {
+        assert_eq!(r#"[Same("a"), Add("b"), Same("c\n")]"#,
+                   diff_str(calculate_line_diff("a\nc\n", "a\nb\nc\n")));
+    }
+
+    #[test]
+    fn line_diff_remove() {
+        assert_eq!(r#"[Same("a"), Remove("b")]"#,
+                   diff_str(calculate_line_diff("a\nb", "a")));
+    }
+
+    #[test]
+    fn line_diff_replace() {
+        assert_eq!(r#"[Same("a"), Replace("b", "x"), Same("c")]"#,
+                   diff_str(calculate_line_diff("a\nb\nc", "a\nx\nc")));
+    }
+
+    #[test]
+    fn char_diff_replace() {
+        assert_eq!(r#"[Same("h"), Replace("e", "a"), Same("llo")]"#,
+                   diff_str(calculate_char_diff("hello", "hallo")));
+        assert_eq!("[Same(\"\u{e9}\"), Add(\"\u{e8}\")]",
+                   diff_str(calculate_char_diff("\u{e9}", "\u{e9}\u{e8}")));
+    }
 }
@@ -0,0 +1,219 @@
+use super::lcs::{Chunk, chunks_from_matches};
+use std::cmp::max;
+use std::ops::{Index, IndexMut, Range};
+use std::vec::Vec;
+
+// A Myers V array: the furthest reaching x for each diagonal k, where k may be
+// negative.
+struct V {
+    offset: isize,
+    v: Vec<usize>,
+}
+
+impl V {
+    fn new(max_d: usize) -> V {
+        V { offset: max_d as isize, v: vec![0; 2 * max_d + 1] }
+    }
+}
+
+impl Index<isize> for V {
+    type Output = usize;
+
+    fn index(&self, k: isize) -> &usize {
+        &self.v[(k + self.offset) as usize]
+    }
+}
+
+impl IndexMut<isize> for V {
+    fn index_mut(&mut self, k: isize) -> &mut usize {
+        &mut self.v[(k + self.offset) as usize]
+    }
+}
+
+fn common_prefix_len<T: PartialEq>(a: &[T], b: &[T]) -> usize {
+    a.iter().zip(b).take_while(|(x, y)| x == y).count()
+}
+
+fn common_suffix_len<T: PartialEq>(a: &[T], b: &[T]) -> usize {
+    a.iter().rev().zip(b.iter().rev()).take_while(|(x, y)| x == y).count()
+}
+
+// Computes the length of the LCS of a with each prefix of b, in O(NM) time and
+// O(M) space.
+fn lcs_lengths<'t, T: 't + PartialEq>(a: impl Iterator<Item = &'t T>,
+                                     b: impl Iterator<Item = &'t T> + Clone,
+                                     b_len: usize) -> Vec<usize> {
+    let mut row = vec![0; b_len + 1];
+    for a_elem in a {
+        let mut diagonal = 0;
+        for (j, b_elem) in b.clone().enumerate() {
+            let above = row[j + 1];
+            row[j + 1] = if a_elem == b_elem { diagonal + 1 } else { max(above, row[j]) };
+            diagonal = above;
+        }
+    }
+    row
+}
+
+// Finds a point (x, y) which an optimal edit script between a and b passes
+// through, with x halfway along a, as in Hirschberg's algorithm: the LCS
+// lengths of a[..x] against each prefix of b and of a[x..] against each suffix
+// of b are computed, and y is where their sum is greatest. This takes O(NM)
+// time regardless of how different a and b are.
+fn lcs_split<T: PartialEq>(a: &[T], b: &[T]) -> (usize, usize) {
+    let x = a.len() / 2;
+    let forward = lcs_lengths(a[..x].iter(), b.iter(), b.len());
+    let backward = lcs_lengths(a[x..].iter().rev(), b.iter().rev(), b.len());
+    let y = (0..=b.len()).max_by_key(|&y| forward[y] + backward[b.len() - y])
+                         .expect("there is always at least one split");
+    (x, y)
+}
+
+// Finds the start of the middle snake of an optimal edit script between a and
+// b, by running the greedy Myers search forwards from the start and backwards
+// from the end until the two meet. Both a and b must be non-empty.
+// The search takes O((N+M)D) time, which for very different sequences (e.g. a
+// file pruned down to a few of its lines) is far worse than the O(NM) of an
+// LCS table. So, as GNU diff does, the search is abandoned once it has cost
+// more than an LCS would, returning None. It is only abandoned when a has at
+// least two elements, so that splitting a halfway always makes progress.
+fn find_middle_snake<T: PartialEq>(a: &[T], b: &[T], vf: &mut V, vb: &mut V)
+        -> Option<(usize, usize)> {
+    let n = a.len() as isize;
+    let m = b.len() as isize;
+    let delta = n - m;
+    let odd = delta & 1 == 1;
+    vf[1] = 0;
+    vb[1] = 0;
+    let max_d = (n + m + 1) / 2;
+    for d in 0..=max_d {
+        if n > 1 && n.saturating_mul(m) < (n + m).saturating_mul(d) {
+            return None;
+        }
+        // Extend the forward paths.
+        for k in (-d..=d).rev().step_by(2) {
+            let mut x = if k == -d || (k != d && vf[k - 1] < vf[k + 1]) {
+                vf[k + 1] as isize
+            } else {
+                vf[k - 1] as isize + 1
+            };
+            let y = x - k;
+            let (x0, y0) = (x, y);
+            if x < n && y < m {
+                x += common_prefix_len(&a[x as usize..], &b[y as usize..]) as isize;
+            }
+            vf[k] = x as usize;
+            if odd && (k - delta).abs() <= d - 1 && x + vb[delta - k] as isize >= n {
+                return Some((x0 as usize, y0 as usize));
+            }
+        }
+        // Extend the backward paths (where x counts from the end of a).
+        for k in (-d..=d).rev().step_by(2) {
+            let mut x = if k == -d || (k != d && vb[k - 1] < vb[k + 1]) {
+                vb[k + 1] as isize
+            } else {
+                vb[k - 1] as isize + 1
+            };
+            let mut y = x - k;
+            if x < n && y < m {
+                let advance = common_suffix_len(&a[..(n - x) as usize],
+                                                &b[..(m - y) as usize]) as isize;
+                x += advance;
+                y += advance;
+            }
+            vb[k] = x as usize;
+            if !odd && (k - delta).abs() <= d && x + vf[delta - k] as isize >= n {
+                return Some(((n - x) as usize, (m - y) as usize));
+            }
+        }
+    }
+    unreachable!("the forward and backward searches always meet")
+}
+
+// Recursively finds the matching elements of a[a_range] and b[b_range],
+// appending them to matches in ascending order.
+fn conquer<T: PartialEq>(a: &[T], mut a_range: Range<usize>,
+                         b: &[T], mut b_range: Range<usize>,
+                         vf: &mut V, vb: &mut V,
+                         matches: &mut Vec<(usize, usize)>) {
+    let prefix = common_prefix_len(&a[a_range.clone()], &b[b_range.clone()]);
+    matches.extend((0..prefix).map(|i| (a_range.start + i, b_range.start + i)));
+    a_range.start += prefix;
+    b_range.start += prefix;
+    let suffix = common_suffix_len(&a[a_range.clone()], &b[b_range.clone()]);
+    a_range.end -= suffix;
+    b_range.end -= suffix;
+    if !a_range.is_empty() && !b_range.is_empty() {
+        let (a_mid, b_mid) = (&a[a_range.clone()], &b[b_range.clone()]);
+        let (x, y) = match find_middle_snake(a_mid, b_mid, vf, vb) {
+            Some(snake) => snake,
+            None => lcs_split(a_mid, b_mid),
+        };
+        let (x, y) = (a_range.start + x, b_range.start + y);
+        conquer(a, a_range.start..x, b, b_range.start..y, vf, vb, matches);
+        conquer(a, x..a_range.end, b, y..b_range.end, vf, vb, matches);
+    }
+    matches.extend((0..suffix).map(|i| (a_range.end + i, b_range.end + i)));
+}
+
+// Computes the edit script transforming a into b using Myers' O(ND) difference
+// algorithm, in its linear space (divide and conquer) form, falling back on
+// Hirschberg's O(NM) LCS where that would be cheaper.
+pub fn chunks<T: PartialEq>(a: &[T], b: &[T]) -> Vec<Chunk> {
+    let max_d = (a.len() + b.len() + 1) / 2 + 1;
+    let mut vf = V::new(max_d);
+    let mut vb = V::new(max_d);
+    let mut matches = Vec::new();
+    conquer(a, 0..a.len(), b, 0..b.len(), &mut vf, &mut vb, &mut matches);
+    chunks_from_matches(matches, a.len(), b.len())
+}
+
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn char_chunks(a: &str, b: &str) -> Vec<Chunk> {
+        let a: Vec<char> = a.chars().collect();
+        let b: Vec<char> = b.chars().collect();
+        chunks(&a, &b)
+    }
+
+    #[test]
+    fn chunks_empty() {
+        assert_eq!(Vec::<Chunk>::new(), char_chunks("", ""));
+        assert_eq!(vec![Chunk::Add(3)], char_chunks("", "abc"));
+        assert_eq!(vec![Chunk::Remove(3)], char_chunks("abc", ""));
+    }
+
+    #[test]
+    fn chunks_replace() {
+        assert_eq!(vec![Chunk::Same(1), Chunk::Remove(1), Chunk::Add(1), Chunk::Same(3)],
+                   char_chunks("hello", "hallo"));
+    }
+
+    #[test]
+    fn chunks_lines() {
+        let a = vec!["a", "b", "c", "d"];
+        let b = vec!["a", "c", "x", "d", "e"];
+        assert_eq!(vec![Chunk::Same(1), Chunk::Remove(1), Chunk::Same(1), Chunk::Add(1),
+                        Chunk::Same(1), Chunk::Add(1)],
+                   chunks(&a, &b));
+    }
+
+    #[test]
+    fn chunks_pruned() {
+        // Almost every line is removed, which Myers alone is slow at.
+        let mut a = Vec::new();
+        let mut b = Vec::new();
+        let mut expected = Vec::new();
+        for i in 0..50 {
+            a.push(format!("anchor {}", i));
+            b.push(format!("anchor {}", i));
+            a.extend((0..20).map(|j| format!("line {} {}", i, j)));
+            expected.push(Chunk::Same(1));
+            expected.push(Chunk::Remove(20));
+        }
+        assert_eq!(expected, chunks(&a, &b));
+    }
+}
@@ -35,10 +35,13 @@ pub fn wrap_str<'a>(s: &'a str, width: usize) -> WrappedStrIter<'a> {
 }
 
 pub struct WrappedANSIStringsIter<'u> {
-    s_ansi: ANSIStrings<'u>,
+    s_ansi: &'u [ANSIString<'u>],
     unstyled_len: usize,
     wrap_at: usize,
     cur_pos: usize,
+    cur_frag: usize,
+    cur_frag_pos: usize,
+    split: Vec<ANSIString<'u>>,
     output_once: bool,
 }
 
@@ -50,19 +53,38 @@ impl<'s, 'u> Iterator for WrappedANSIStringsIter<'u> where 'u: 's  {
             return None;
         }
         self.output_once = true;
-        let start_pos = self.cur_pos;
         if self.unstyled_len <= self.wrap_at {
             self.cur_pos = self.unstyled_len;
             let padding_required = self.wrap_at - self.unstyled_len;
-            let fmt = format!("{}{:w$}", self.s_ansi, "", w=padding_required);
+            let fmt = format!("{}{:w$}", ANSIStrings(self.s_ansi), "", w=padding_required);
             return Some(fmt);
         } else {
-            let split = ansi_term::sub_string(start_pos, self.wrap_at, &self.s_ansi);
-            let split_fmt = ANSIStrings(split.as_slice());
-            let split_len = ansi_term::unstyled_len(&split_fmt);
+            // Slice the next wrap_at bytes out of the fragments, resuming from
+            // where the previous line stopped rather than seeking from the
+            // start of the string each time. The slices borrow from the
+            // fragments, so nothing is copied until the line is formatted,
+            // and are collected into a buffer reused across lines.
+            let frags = self.s_ansi;
+            self.split.clear();
+            let mut remaining = self.wrap_at;
+            while remaining > 0 && self.cur_frag < frags.len() {
+                let frag = &frags[self.cur_frag];
+                let frag_str: &str = frag;
+                let end = min(self.cur_frag_pos + remaining, frag_str.len());
+                if end > self.cur_frag_pos {
+                    self.split.push(frag.style_ref().paint(&frag_str[self.cur_frag_pos..end]));
+                    remaining -= end - self.cur_frag_pos;
+                }
+                self.cur_frag_pos = end;
+                if self.cur_frag_pos >= frag_str.len() {
+                    self.cur_frag += 1;
+                    self.cur_frag_pos = 0;
+                }
+            }
+            let split_len = self.wrap_at - remaining;
             self.cur_pos += split_len;
             let padding_required = self.wrap_at - split_len;
-            let fmt = format!("{}{:w$}", split_fmt, "", w=padding_required);
+            let fmt = format!("{}{:w$}", ANSIStrings(&self.split), "", w=padding_required);
             return Some(fmt);
         }
     }
@@ -71,10 +93,13 @@ impl<'s, 'u> Iterator for WrappedANSIStringsIter<'u> where 'u: 's  {
 pub fn wrap_ansistrings<'s, 'u>(s: &'s Vec<ANSIString<'u>>, width: usize)
         -> WrappedANSIStringsIter<'s> where 'u: 's {
     WrappedANSIStringsIter {
-        s_ansi: ANSIStrings(s.as_slice()),
+        s_ansi: s.as_slice(),
         unstyled_len: ansi_term::unstyled_len(&ANSIStrings(s.as_slice())),
         wrap_at: width,
         cur_pos: 0,
+        cur_frag: 0,
+        cur_frag_pos: 0,
+        split: Vec::new(),
         output_once: false,
     }
 }
@@ -166,6 +191,17 @@ mod tests {
         assert_eq!(s_fmt, wrapped);
     }
 
+    #[test]
+    fn wrap_ansi_multi_line_fragments() {
+        let s = vec![Red.paint("hel"), Green.paint(""), Green.paint("lo wo"), Red.paint("rld")];
+        let s_fmt = vec![format!("{}", ANSIStrings(&[Red.paint("hel"), Green.paint("l")])),
+                         format!("{}", Green.paint("o wo")),
+                         format!("{} ", Red.paint("rld"))];
+        let wrapped: Vec<String> = wrap_ansistrings(&s, 4).collect();
+        assert_eq!(3, wrapped.len());
+        assert_eq!(s_fmt, wrapped);
+    }
+
     #[test]
     fn wrap_ansi_multi_line_exact() {
         let s = vec![Red.paint("hello")];
@@ -2,6 +2,7 @@ mod diff;
 
 use std::cmp::max;
 use std::fs;
+use std::io;
 use std::process;
 use clap::{Arg, App};
 
@@ -51,9 +52,18 @@ fn main() {
     let diffs = diff::calculate_line_diff(&lfile, &rfile);
 
     // Print the changeset.
-    if side_by_side {
-        diff::print_diffs_side_by_side(&diffs, max_line_count, 0, color);
+    let result = if side_by_side {
+        diff::print_diffs_side_by_side(&diffs, max_line_count, 0, color)
     } else {
-        diff::print_diffs(&diffs, 0, color);
+        diff::print_diffs(&diffs, 0, color)
+    };
+    // The reader going away early (e.g. piping into head, or quitting less)
+    // is not an error.
+    match result {
+        Err(ref error) if error.kind() != io::ErrorKind::BrokenPipe => {
+            eprintln!("Could not write diff: {}", error);
+            process::exit(1);
+        },
+        _ => {},
     }
 }